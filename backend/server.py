@@ -1,16 +1,28 @@
 from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import CursorType, ReplaceOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, CollectionInvalid, DuplicateKeyError
 import os
+import asyncio
+import gzip
+import io
+import json
 import logging
+import random
 import re
+import socket
 import httpx
+import xml.etree.ElementTree as ET
+from collections import deque
+from functools import lru_cache, partial
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional
+from typing import List, Literal, Optional, get_args
 import uuid
-from datetime import datetime, timezone
+from datetime import datetime, timezone, timedelta
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -26,6 +38,18 @@ app = FastAPI()
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
+# Maximum number of ids accepted by /channels/lookup
+CHANNEL_LOOKUP_MAX = int(os.environ.get('CHANNEL_LOOKUP_MAX', '200'))
+# Maximum number of favorites accepted by the bulk and import endpoints, so a
+# full export can be imported back in one request
+FAVORITES_BATCH_MAX = int(os.environ.get('FAVORITES_BATCH_MAX', '10000'))
+
+# Default parental control rules, matched case-insensitively as whole words
+# against names and groups. A bare "adult" would hide things like "Adult Swim".
+DEFAULT_PARENTAL_KEYWORDS = [
+    "xxx", "adults", "adultos", "+18", "18+", "porn", "porno", "erotic", "erotico", "erótico",
+]
+
 # ============ MODELS ============
 
 class Channel(BaseModel):
@@ -38,6 +62,7 @@ class Channel(BaseModel):
     tvg_id: Optional[str] = None
     tvg_name: Optional[str] = None
     is_radio: bool = False
+    restricted: bool = False
     playlist_id: str
 
 class Playlist(BaseModel):
@@ -46,37 +71,51 @@ class Playlist(BaseModel):
     name: str
     url: Optional[str] = None
     is_custom: bool = False
+    refresh_interval: Optional[int] = None  # minutes; None uses the default, 0 disables
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class PlaylistCreate(BaseModel):
     name: str
     url: str
+    refresh_interval: Optional[int] = None
 
 class Favorite(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     channel_id: str
     channel_name: str
-    channel_url: str
+    # Resolved from the channel on read; the stored name and URL are only a
+    # fallback for when the channel is gone
+    channel_url: Optional[str] = None
     channel_logo: Optional[str] = None
     channel_group: Optional[str] = None
+    available: bool = True
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class FavoriteCreate(BaseModel):
     channel_id: str
     channel_name: str
-    channel_url: str
+    channel_url: Optional[str] = None
     channel_logo: Optional[str] = None
     channel_group: Optional[str] = None
 
+class FavoritesImport(BaseModel):
+    favorites: List[FavoriteCreate]
+
+class ChannelIds(BaseModel):
+    channel_ids: List[str]
+
 class Settings(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = "default"
     player_quality: str = "auto"
     buffer_size: int = 30
     epg_url: Optional[str] = None
+    epg_refresh_interval: int = 720  # minutes; 0 disables
     parental_control: bool = False
     parental_pin: Optional[str] = None
+    parental_keywords: List[str] = Field(default_factory=lambda: list(DEFAULT_PARENTAL_KEYWORDS))
+    parental_groups: List[str] = []
     ui_scale: str = "normal"
     language: str = "es"
 
@@ -98,6 +137,11 @@ class Message(BaseModel):
     read: bool = False
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+class MessageCreate(BaseModel):
+    title: str
+    content: str
+    type: str = "info"
+
 class VODItem(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -108,6 +152,7 @@ class VODItem(BaseModel):
     category: str = "Movies"
     year: Optional[int] = None
     rating: Optional[float] = None
+    restricted: bool = False
     playlist_id: str
 
 class SeriesItem(BaseModel):
@@ -121,8 +166,34 @@ class SeriesItem(BaseModel):
     year: Optional[int] = None
     rating: Optional[float] = None
     episodes: List[dict] = []
+    restricted: bool = False
     playlist_id: str
 
+WatchItemType = Literal["channel", "vod", "series"]
+WATCH_ITEM_TYPES = get_args(WatchItemType)
+
+class WatchProgress(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    item_id: str
+    item_type: WatchItemType = "channel"
+    title: str
+    url: Optional[str] = None
+    poster: Optional[str] = None
+    position: float = Field(default=0, ge=0)  # seconds
+    duration: Optional[float] = Field(default=None, ge=0)
+    episode: Optional[int] = None
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+class WatchProgressUpdate(BaseModel):
+    item_id: str
+    item_type: WatchItemType = "channel"
+    title: str
+    url: Optional[str] = None
+    poster: Optional[str] = None
+    position: float = Field(default=0, ge=0)
+    duration: Optional[float] = Field(default=None, ge=0)
+    episode: Optional[int] = None
+
 # ============ M3U PARSER ============
 
 def parse_m3u(content: str, playlist_id: str) -> tuple:
@@ -201,6 +272,760 @@ def parse_m3u(content: str, playlist_id: str) -> tuple:
     
     return channels, vod_items, series_items
 
+# ============ EVENTS ============
+#
+# Server-Sent Events for ingest progress, new messages and catalog changes.
+# Events are written to a capped `events` collection and every worker tails
+# it, so a client connected to any worker sees events published on all of
+# them. Each client has a bounded queue; a slow client loses its oldest
+# events instead of holding memory or blocking the others.
+
+EVENTS_QUEUE_SIZE = int(os.environ.get('EVENTS_QUEUE_SIZE', '100'))
+EVENTS_HEARTBEAT_SECONDS = float(os.environ.get('EVENTS_HEARTBEAT_SECONDS', '15'))
+EVENTS_LOG_BYTES = int(os.environ.get('EVENTS_LOG_BYTES', str(16 * 1024 * 1024)))
+# How many sequence numbers are re-read when the tail cursor is reopened, to
+# catch events whose sequence was allocated before one inserted ahead of them
+EVENTS_RESUME_WINDOW = int(os.environ.get('EVENTS_RESUME_WINDOW', '100'))
+
+event_subscribers = set()
+event_tasks = set()
+
+def format_sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+def dispatch_event(message: str):
+    for queue in event_subscribers:
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(message)
+
+async def publish_event(event: str, data: dict):
+    """Publish an event to SSE clients on every worker"""
+    try:
+        counter = await db.meta.find_one_and_update(
+            {"_id": "events"},
+            {"$inc": {"seq": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        await db.events.insert_one({"seq": counter['seq'], "event": event, "data": data})
+    except Exception:
+        logger.exception(f"Failed to publish {event} event")
+
+async def publish_ingest_progress(playlist_id: str, name: str, stage: str, **counts):
+    await publish_event("ingest", {"playlist_id": playlist_id, "name": name, "stage": stage, **counts})
+
+async def get_catalog_version() -> int:
+    doc = await db.meta.find_one({"_id": "catalog"})
+    return doc['version'] if doc else 0
+
+async def bump_catalog_version(reason: str):
+    doc = await db.meta.find_one_and_update(
+        {"_id": "catalog"},
+        {"$inc": {"version": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    await publish_event("catalog", {"version": doc['version'], "reason": reason})
+
+async def ensure_event_log():
+    try:
+        await db.create_collection("events", capped=True, size=EVENTS_LOG_BYTES)
+    except CollectionInvalid:
+        pass  # already created by another worker
+    await db.events.create_index("seq")
+
+async def event_tail_loop():
+    # Only relay events published from now on
+    last = await db.events.find_one({}, sort=[("seq", -1)])
+    floor = last['seq'] if last and 'seq' in last else 0
+    highest = floor
+    relayed = deque(maxlen=EVENTS_RESUME_WINDOW * 2)
+    
+    while True:
+        # Tailable cursors ignore indexes, so opening one scans the capped
+        # collection. Keep it open across empty getMores and only reopen once
+        # the server has killed it.
+        cursor = db.events.find({"seq": {"$gt": floor}}, cursor_type=CursorType.TAILABLE_AWAIT)
+        try:
+            while cursor.alive:
+                # Motor ends iteration after an empty await, not only when the cursor dies
+                async for doc in cursor:
+                    if doc['seq'] in relayed:
+                        continue
+                    relayed.append(doc['seq'])
+                    highest = max(highest, doc['seq'])
+                    dispatch_event(format_sse(doc['event'], doc['data']))
+        except Exception:
+            logger.exception("Event tail cursor failed")
+        # A reopened cursor can miss events whose sequence was allocated before
+        # one inserted ahead of them, so re-read a window and dedupe by seq
+        floor = max(floor, highest - EVENTS_RESUME_WINDOW)
+        # Tailable cursors die on an empty collection; wait and reopen
+        await asyncio.sleep(1)
+
+async def event_heartbeat_loop():
+    # One timer for all clients keeps idle connections cheap
+    while True:
+        await asyncio.sleep(EVENTS_HEARTBEAT_SECONDS)
+        for queue in event_subscribers:
+            if not queue.full():
+                queue.put_nowait(": ping\n\n")
+
+# ============ PARENTAL CONTROL ============
+#
+# Items are classified once, when they are ingested, into an indexed
+# `restricted` flag. With parental control on, list endpoints only add
+# `restricted: False` to their query instead of matching names per request.
+
+# (collection, title field, group field) of every classified catalog
+PARENTAL_CATALOGS = (
+    ("channels", "name", "group"),
+    ("vod", "title", "category"),
+    ("series", "title", "category"),
+)
+
+reclassify_tasks = set()
+
+@lru_cache(maxsize=8)
+def compile_parental_rules(keywords: tuple, groups: tuple) -> tuple:
+    """Build the (keyword pattern, groups) rules used by is_restricted.
+
+    Keywords match whole words only, so a keyword never matches inside a
+    longer word. Compiled once per distinct rules set.
+    """
+    pattern = None
+    if keywords:
+        alternatives = '|'.join(re.escape(k) for k in sorted(keywords, key=len, reverse=True))
+        pattern = re.compile(rf'(?<!\w)(?:{alternatives})(?!\w)', re.IGNORECASE)
+    return pattern, frozenset(groups)
+
+async def get_parental_rules() -> tuple:
+    doc = await db.settings.find_one({"id": "default"}, {"_id": 0}) or {}
+    settings = Settings(**doc)
+    keywords = tuple(k.strip().lower() for k in settings.parental_keywords if k.strip())
+    groups = tuple(sorted(g.strip().lower() for g in settings.parental_groups if g.strip()))
+    return compile_parental_rules(keywords, groups)
+
+def is_restricted(title: Optional[str], group: Optional[str], rules: tuple) -> bool:
+    pattern, groups = rules
+    if group and group.lower() in groups:
+        return True
+    if pattern is None:
+        return False
+    return bool(pattern.search(title or '') or pattern.search(group or ''))
+
+def classify_items(rules: tuple, channels: list, vod_items: list, series_items: list):
+    for channel in channels:
+        channel.restricted = is_restricted(channel.name, channel.group, rules)
+    for item in vod_items + series_items:
+        item.restricted = is_restricted(item.title, item.category, rules)
+
+def classify_programs(rules: tuple, restricted_channels: set, programs: List[dict]):
+    for p in programs:
+        p['restricted'] = p['channel_id'] in restricted_channels or is_restricted(p['title'], None, rules)
+
+async def restricted_epg_channels() -> set:
+    return set(await db.channels.distinct("tvg_id", {"restricted": True}))
+
+async def parental_enabled() -> bool:
+    settings = await db.settings.find_one({"id": "default"}, {"_id": 0, "parental_control": 1})
+    return bool(settings and settings.get('parental_control'))
+
+async def parental_query(query: dict) -> dict:
+    """Add the restricted filter to a catalog query when parental control is on"""
+    if await parental_enabled():
+        query["restricted"] = False
+    return query
+
+async def restricted_item_ids(items: List[dict]) -> set:
+    """Return the ids of watch history items whose catalog entry is restricted"""
+    collections = {"channel": db.channels, "vod": db.vod, "series": db.series}
+    restricted = set()
+    for item_type, collection in collections.items():
+        ids = [i['item_id'] for i in items if i['item_type'] == item_type]
+        if ids:
+            restricted.update(await collection.distinct("id", {"id": {"$in": ids}, "restricted": True}))
+    return restricted
+
+async def reclassify_collection(collection, title_field: str, group_field: Optional[str], rules: tuple,
+                                query: dict, restricted_channels: Optional[set] = None) -> Optional[int]:
+    """Re-apply the rules to a collection, writing only documents whose flag changes.
+
+    Returns None without writing further batches if the rules changed since
+    the pass started, so a stale pass never overwrites a newer one.
+    """
+    changed = 0
+    ops = []
+    projection = {"_id": 1, title_field: 1, "restricted": 1}
+    if group_field:
+        projection[group_field] = 1
+    if restricted_channels is not None:
+        projection["channel_id"] = 1
+    
+    async def write():
+        if await get_parental_rules() != rules:
+            return False
+        await collection.bulk_write(ops, ordered=False)
+        return True
+    
+    async for doc in collection.find(query, projection):
+        restricted = is_restricted(doc.get(title_field), doc.get(group_field) if group_field else None, rules)
+        if restricted_channels is not None:
+            restricted = restricted or doc.get('channel_id') in restricted_channels
+        if doc.get('restricted') is not restricted:
+            ops.append(UpdateOne({"_id": doc['_id']}, {"$set": {"restricted": restricted}}))
+        if len(ops) >= 1000:
+            if not await write():
+                return None
+            changed += len(ops)
+            ops = []
+    if ops:
+        if not await write():
+            return None
+        changed += len(ops)
+    return changed
+
+async def reclassify_catalog(only_unclassified: bool = False):
+    rules = await get_parental_rules()
+    query = {"restricted": {"$exists": False}} if only_unclassified else {}
+    
+    changed = 0
+    targets = [(db[name], title_field, group_field) for name, title_field, group_field in PARENTAL_CATALOGS]
+    # EPG programmes follow their channel, so they go last
+    targets.append((db.epg, "title", None))
+    for collection, title_field, group_field in targets:
+        restricted_channels = await restricted_epg_channels() if collection is db.epg else None
+        result = await reclassify_collection(collection, title_field, group_field, rules, query, restricted_channels)
+        if result is None:
+            logger.info("Parental control rules changed, abandoning superseded reclassification")
+            return
+        changed += result
+    
+    logger.info(f"Parental control reclassification updated {changed} items")
+    if changed:
+        await bump_catalog_version("parental")
+
+async def reclassify_epg_for_channels(channels: list):
+    """Re-flag the guide of freshly ingested channels.
+
+    Programmes are otherwise only flagged when the EPG itself is refreshed,
+    so a newly imported restricted channel would show its guide until then.
+    """
+    tvg_ids = list({c.tvg_id for c in channels if c.tvg_id})
+    if not tvg_ids:
+        return
+    await reclassify_collection(
+        db.epg, "title", None, await get_parental_rules(),
+        {"channel_id": {"$in": tvg_ids}}, await restricted_epg_channels()
+    )
+
+async def has_unclassified_items() -> bool:
+    # Index-backed: every classified collection has an index led by `restricted`
+    for name in [c[0] for c in PARENTAL_CATALOGS] + ["epg"]:
+        if await db[name].find_one({"restricted": {"$exists": False}}, {"_id": 1}):
+            return True
+    return False
+
+def schedule_reclassification(only_unclassified: bool = False):
+    # A newer rules change supersedes any pass still running on this worker
+    for task in list(reclassify_tasks):
+        task.cancel()
+    task = asyncio.create_task(reclassify_catalog(only_unclassified))
+    reclassify_tasks.add(task)
+    task.add_done_callback(reclassify_tasks.discard)
+
+# ============ INGEST ============
+
+async def fetch_source(url: str) -> bytes:
+    """Download a playlist or EPG source, transparently un-gzipping it"""
+    async with httpx.AsyncClient(timeout=30.0) as client_http:
+        response = await client_http.get(url)
+        response.raise_for_status()
+        content = response.content
+    if content[:2] == b'\x1f\x8b':
+        content = await asyncio.to_thread(gzip.decompress, content)
+    return content
+
+async def replace_playlist_items(playlist_id: str, channels: list, vod_items: list, series_items: list):
+    """Upsert freshly parsed items and drop those no longer in the playlist.
+
+    Items whose stream URL (or series title) is unchanged keep their previous
+    id, so favorites and other references survive a refresh.
+    """
+    targets = (
+        (db.channels, channels, 'url'),
+        (db.vod, vod_items, 'url'),
+        (db.series, series_items, 'title'),
+    )
+    for collection, items, key in targets:
+        existing = await collection.find(
+            {"playlist_id": playlist_id}, {"_id": 0, "id": 1, key: 1}
+        ).to_list(None)
+        known = {doc.get(key): doc['id'] for doc in existing}
+        
+        docs = []
+        used_ids = set()
+        for item in items:
+            previous_id = known.get(getattr(item, key))
+            if previous_id and previous_id not in used_ids:
+                item.id = previous_id
+            used_ids.add(item.id)
+            docs.append(item.model_dump())
+        
+        if docs:
+            await collection.bulk_write(
+                [ReplaceOne({"id": d['id']}, d, upsert=True) for d in docs],
+                ordered=False
+            )
+        await collection.delete_many({"playlist_id": playlist_id, "id": {"$nin": list(used_ids)}})
+
+async def refresh_playlist(playlist: dict):
+    progress = partial(publish_ingest_progress, playlist['id'], playlist['name'])
+    try:
+        await progress("fetching")
+        content = await fetch_source(playlist['url'])
+        channels, vod_items, series_items = await asyncio.to_thread(
+            parse_m3u, content.decode('utf-8', errors='replace'), playlist['id']
+        )
+        await asyncio.to_thread(classify_items, await get_parental_rules(), channels, vod_items, series_items)
+        
+        # The playlist may have been deleted while we were downloading it
+        if not await db.playlists.find_one({"id": playlist['id']}, {"_id": 1}):
+            return
+        await progress("storing", channels=len(channels), vod=len(vod_items), series=len(series_items))
+        await replace_playlist_items(playlist['id'], channels, vod_items, series_items)
+        await reclassify_epg_for_channels(channels)
+    except Exception as e:
+        await progress("error", error=str(e))
+        raise
+    
+    await progress("done", channels=len(channels), vod=len(vod_items), series=len(series_items))
+    await bump_catalog_version("playlist")
+    logger.info(
+        f"Refreshed playlist {playlist['id']}: {len(channels)} channels, "
+        f"{len(vod_items)} VOD, {len(series_items)} series"
+    )
+
+# ============ EPG ============
+
+def parse_xmltv_time(value: Optional[str]) -> Optional[datetime]:
+    value = (value or '').strip()
+    for fmt in ('%Y%m%d%H%M%S %z', '%Y%m%d%H%M%S'):
+        try:
+            parsed = datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed.astimezone(timezone.utc)
+    return None
+
+def parse_xmltv(content: bytes) -> List[dict]:
+    """Parse XMLTV content and return programme documents.
+
+    Elements are streamed and discarded as they are read, so large guides
+    never exist as a full tree. Programmes without a stop time end when the
+    next programme on the same channel starts.
+    """
+    programs = []
+    
+    for _, elem in ET.iterparse(io.BytesIO(content), events=('end',)):
+        if elem.tag == 'programme':
+            start = parse_xmltv_time(elem.get('start'))
+            end = parse_xmltv_time(elem.get('stop'))
+            if start:
+                programs.append({
+                    "id": str(uuid.uuid4()),
+                    "channel_id": elem.get('channel'),
+                    "title": elem.findtext('title') or "",
+                    "start": start.isoformat(),
+                    "end": end.isoformat() if end else None,
+                    "description": elem.findtext('desc'),
+                })
+            elem.clear()
+        elif elem.tag == 'channel':
+            elem.clear()
+    
+    by_channel = {}
+    for p in programs:
+        by_channel.setdefault(p['channel_id'], []).append(p)
+    for schedule in by_channel.values():
+        schedule.sort(key=lambda p: p['start'])
+        for current, following in zip(schedule, schedule[1:]):
+            if current['end'] is None:
+                current['end'] = following['start']
+    
+    return programs
+
+async def refresh_epg(epg_url: str):
+    content = await fetch_source(epg_url)
+    programs = await asyncio.to_thread(parse_xmltv, content)
+    
+    # Keep yesterday onwards so catch-up still has something to show
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=1)).isoformat()
+    programs = [p for p in programs if (p['end'] or p['start']) >= cutoff]
+    
+    await asyncio.to_thread(
+        classify_programs, await get_parental_rules(), await restricted_epg_channels(), programs
+    )
+    
+    # Swap in the new guide by version so readers never see it half empty
+    version = str(uuid.uuid4())
+    for p in programs:
+        p['version'] = version
+    if programs:
+        await db.epg.insert_many(programs, ordered=False)
+    await db.epg.delete_many({"version": {"$ne": version}})
+    await bump_catalog_version("epg")
+    logger.info(f"Refreshed EPG from {epg_url}: {len(programs)} programmes")
+
+# ============ SCHEDULER ============
+#
+# Every worker runs the scheduler loop, but each job is guarded by a lease in
+# the `scheduler_jobs` collection. A worker may only run a job after atomically
+# claiming a due, unleased job document, so each refresh happens on exactly one
+# worker across the deployment. Leases are renewed while a job runs.
+#
+# Concurrency is capped deployment-wide the same way: a worker must also lease
+# one of SCHEDULER_MAX_CONCURRENCY documents in `scheduler_slots` first.
+
+SCHEDULER_ENABLED = os.environ.get('SCHEDULER_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+SCHEDULER_TICK_SECONDS = float(os.environ.get('SCHEDULER_TICK_SECONDS', '60'))
+SCHEDULER_MAX_CONCURRENCY = int(os.environ.get('SCHEDULER_MAX_CONCURRENCY', '2'))
+SCHEDULER_LEASE_SECONDS = int(os.environ.get('SCHEDULER_LEASE_SECONDS', '900'))
+SCHEDULER_JITTER = float(os.environ.get('SCHEDULER_JITTER', '0.1'))
+SCHEDULER_BACKOFF_SECONDS = int(os.environ.get('SCHEDULER_BACKOFF_SECONDS', '300'))
+PLAYLIST_REFRESH_MINUTES = int(os.environ.get('PLAYLIST_REFRESH_MINUTES', '360'))
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+SCHEDULER_SLOT_IDS = [f"slot:{i}" for i in range(SCHEDULER_MAX_CONCURRENCY)]
+scheduler_tasks = set()
+
+def jittered(seconds: float) -> float:
+    return seconds * (1 + random.uniform(-SCHEDULER_JITTER, SCHEDULER_JITTER))
+
+def playlist_job_id(playlist_id: str) -> str:
+    return f"playlist:{playlist_id}"
+
+def lease_expiry() -> datetime:
+    return datetime.now(timezone.utc) + timedelta(seconds=SCHEDULER_LEASE_SECONDS)
+
+def due_job_query(now: datetime) -> dict:
+    # Manual refreshes are due whatever the interval, even when it is disabled
+    return {
+        "lease_until": {"$lte": now},
+        "$or": [{"next_run_at": {"$lte": now}}, {"refresh_requested": True}],
+    }
+
+async def collect_jobs() -> List[dict]:
+    """Return the refresh jobs for every playlist and the EPG source.
+
+    Jobs whose interval is disabled are still returned, with `interval` set to
+    None, so manual refreshes can run them.
+    """
+    jobs = []
+    
+    playlists = await db.playlists.find({"url": {"$nin": [None, ""]}}, {"_id": 0}).to_list(1000)
+    for p in playlists:
+        minutes = p.get('refresh_interval')
+        if minutes is None:
+            minutes = PLAYLIST_REFRESH_MINUTES
+        jobs.append({
+            "id": playlist_job_id(p['id']),
+            "interval": minutes * 60 if minutes > 0 else None,
+            # The playlist was fetched when it was created
+            "first_delay": jittered(minutes * 60) if minutes > 0 else 0,
+            "run": partial(refresh_playlist, p),
+        })
+    
+    settings = await db.settings.find_one({"id": "default"}, {"_id": 0}) or {}
+    minutes = settings.get('epg_refresh_interval', Settings().epg_refresh_interval)
+    if settings.get('epg_url'):
+        jobs.append({
+            "id": "epg",
+            "interval": minutes * 60 if minutes > 0 else None,
+            "first_delay": 0,
+            "run": partial(refresh_epg, settings['epg_url']),
+        })
+    
+    return jobs
+
+async def claim_slot(job_id: str) -> Optional[str]:
+    now = datetime.now(timezone.utc)
+    slot = await db.scheduler_slots.find_one_and_update(
+        {"_id": {"$in": SCHEDULER_SLOT_IDS}, "lease_until": {"$lte": now}},
+        {"$set": {"owner": WORKER_ID, "job": job_id, "lease_until": lease_expiry()}},
+        projection={"_id": 1}
+    )
+    return slot['_id'] if slot else None
+
+async def release_slot(slot_id: str):
+    await db.scheduler_slots.update_one(
+        {"_id": slot_id, "owner": WORKER_ID},
+        {"$set": {"lease_until": datetime.now(timezone.utc)}}
+    )
+
+async def claim_job(job_id: str) -> bool:
+    now = datetime.now(timezone.utc)
+    claimed = await db.scheduler_jobs.find_one_and_update(
+        {"_id": job_id, **due_job_query(now)},
+        {"$set": {
+            "owner": WORKER_ID,
+            "lease_until": lease_expiry(),
+            # A request arriving while this run is in progress sets it again
+            "refresh_requested": False,
+        }},
+        projection={"_id": 1}
+    )
+    return claimed is not None
+
+async def renew_leases(job_id: str, slot_id: str, lease_lost: asyncio.Event, work: asyncio.Task):
+    while True:
+        await asyncio.sleep(SCHEDULER_LEASE_SECONDS / 3)
+        until = lease_expiry()
+        result = await db.scheduler_jobs.update_one(
+            {"_id": job_id, "owner": WORKER_ID}, {"$set": {"lease_until": until}}
+        )
+        await db.scheduler_slots.update_one(
+            {"_id": slot_id, "owner": WORKER_ID}, {"$set": {"lease_until": until}}
+        )
+        if result.matched_count == 0:
+            # Another worker took the job over; stop rather than run it twice
+            lease_lost.set()
+            work.cancel()
+            return
+
+def next_delay(interval: Optional[float], failures: int) -> Optional[float]:
+    """Seconds until a job runs again, or None when it only runs on request"""
+    if interval is None:
+        return None
+    if failures:
+        return min(interval, SCHEDULER_BACKOFF_SECONDS * 2 ** (failures - 1))
+    return interval
+
+async def run_job(job: dict, slot_id: str):
+    lease_lost = asyncio.Event()
+    work = asyncio.create_task(job['run']())
+    renewer = asyncio.create_task(renew_leases(job['id'], slot_id, lease_lost, work))
+    try:
+        try:
+            await work
+        except asyncio.CancelledError:
+            if not lease_lost.is_set():
+                raise
+            logger.warning(f"Lost the lease on scheduled job {job['id']}, abandoning this run")
+            return
+        except Exception as e:
+            state = await db.scheduler_jobs.find_one({"_id": job['id']}, {"failures": 1}) or {}
+            failures = state.get('failures', 0) + 1
+            fields = {"failures": failures, "last_error": str(e)}
+            logger.warning(f"Scheduled job {job['id']} failed ({failures} in a row): {e}")
+        else:
+            failures = 0
+            fields = {"failures": 0, "last_error": None, "last_success_at": datetime.now(timezone.utc)}
+        
+        now = datetime.now(timezone.utc)
+        delay = next_delay(job['interval'], failures)
+        fields.update({
+            "next_run_at": now + timedelta(seconds=jittered(delay)) if delay is not None else None,
+            "lease_until": now,
+        })
+        await db.scheduler_jobs.update_one({"_id": job['id'], "owner": WORKER_ID}, {"$set": fields})
+    except Exception:
+        logger.exception(f"Could not record result of scheduled job {job['id']}")
+    finally:
+        renewer.cancel()
+        try:
+            await release_slot(slot_id)
+        except Exception:
+            logger.exception(f"Could not release scheduler slot {slot_id}")
+
+async def sync_jobs(jobs: List[dict], now: datetime):
+    """Create missing job documents and follow interval changes"""
+    known = set(await db.scheduler_jobs.distinct("_id"))
+    for job in jobs:
+        if job['id'] in known:
+            continue
+        first_run = now + timedelta(seconds=job['first_delay']) if job['interval'] else None
+        try:
+            await db.scheduler_jobs.update_one(
+                {"_id": job['id']},
+                {"$setOnInsert": {"next_run_at": first_run, "lease_until": now, "failures": 0}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            pass  # another worker seeded it first
+    
+    enabled = [job['id'] for job in jobs if job['interval']]
+    disabled = [job['id'] for job in jobs if not job['interval']]
+    await db.scheduler_jobs.update_many(
+        {"_id": {"$in": enabled}, "next_run_at": None}, {"$set": {"next_run_at": now}}
+    )
+    await db.scheduler_jobs.update_many(
+        {"_id": {"$in": disabled}, "next_run_at": {"$ne": None}}, {"$set": {"next_run_at": None}}
+    )
+
+async def ensure_scheduler_slots():
+    for slot_id in SCHEDULER_SLOT_IDS:
+        try:
+            await db.scheduler_slots.update_one(
+                {"_id": slot_id},
+                {"$setOnInsert": {"lease_until": datetime.now(timezone.utc)}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            pass
+
+async def scheduler_tick():
+    jobs = await collect_jobs()
+    if not jobs:
+        return
+    
+    now = datetime.now(timezone.utc)
+    await sync_jobs(jobs, now)
+    
+    due = set(await db.scheduler_jobs.distinct("_id", due_job_query(now)))
+    for job in jobs:
+        if job['id'] not in due:
+            continue
+        slot_id = await claim_slot(job['id'])
+        if not slot_id:
+            break  # every slot in the deployment is busy
+        if not await claim_job(job['id']):
+            await release_slot(slot_id)
+            continue
+        task = asyncio.create_task(run_job(job, slot_id))
+        scheduler_tasks.add(task)
+        task.add_done_callback(scheduler_tasks.discard)
+
+async def scheduler_loop():
+    await ensure_scheduler_slots()
+    while True:
+        try:
+            await scheduler_tick()
+        except Exception:
+            logger.exception("Scheduler tick failed")
+        await asyncio.sleep(jittered(SCHEDULER_TICK_SECONDS))
+
+# ============ WATCH HISTORY ============
+#
+# Players report progress every few seconds, so updates are coalesced in
+# memory per item and written to Mongo in periodic bulk batches. Reads are
+# served from a small per-worker cache of the most recent items, reloaded
+# from Mongo every HISTORY_CACHE_SECONDS to pick up other workers' writes.
+
+HISTORY_FLUSH_SECONDS = float(os.environ.get('HISTORY_FLUSH_SECONDS', '10'))
+HISTORY_FLUSH_MAX = int(os.environ.get('HISTORY_FLUSH_MAX', '500'))
+HISTORY_CACHE_SIZE = int(os.environ.get('HISTORY_CACHE_SIZE', '200'))
+HISTORY_CACHE_SECONDS = float(os.environ.get('HISTORY_CACHE_SECONDS', '30'))
+HISTORY_FINISHED_RATIO = 0.95
+
+pending_progress = {}
+# The batch being written by flush_progress, still newer than Mongo until it lands
+flushing_progress = {}
+# Items deleted since the last flush began, so an in-flight upsert cannot revive them
+deleted_progress = set()
+# Most recent items per item_type, so zapping channels never evicts VOD progress
+history_cache = {item_type: {} for item_type in WATCH_ITEM_TYPES}
+history_cache_loaded_at = 0.0
+history_flush_wakeup = asyncio.Event()
+history_tasks = set()
+
+def trim_history_cache(item_type: str):
+    cache = history_cache[item_type]
+    if len(cache) <= HISTORY_CACHE_SIZE:
+        return
+    recent = sorted(cache.values(), key=lambda d: d['updated_at'], reverse=True)
+    cache.clear()
+    cache.update((d['item_id'], d) for d in recent[:HISTORY_CACHE_SIZE])
+
+async def load_history_cache():
+    global history_cache_loaded_at
+    fresh = {}
+    for item_type in WATCH_ITEM_TYPES:
+        docs = await db.watch_history.find(
+            {"item_type": item_type}, {"_id": 0}
+        ).sort("updated_at", -1).to_list(HISTORY_CACHE_SIZE)
+        fresh[item_type] = {d['item_id']: d for d in docs if d['item_id'] not in deleted_progress}
+    # Unflushed local updates are newer than anything in Mongo
+    for item_id, doc in list(flushing_progress.items()) + list(pending_progress.items()):
+        if item_id not in deleted_progress:
+            fresh[doc['item_type']][item_id] = doc
+    
+    history_cache.update(fresh)
+    for item_type in WATCH_ITEM_TYPES:
+        trim_history_cache(item_type)
+    history_cache_loaded_at = asyncio.get_running_loop().time()
+
+async def get_history_cache(*item_types: str) -> List[dict]:
+    if asyncio.get_running_loop().time() - history_cache_loaded_at > HISTORY_CACHE_SECONDS:
+        await load_history_cache()
+    items = [doc for item_type in item_types for doc in history_cache[item_type].values()]
+    return sorted(items, key=lambda d: d['updated_at'], reverse=True)
+
+def record_progress(data: WatchProgressUpdate):
+    doc = WatchProgress(**data.model_dump()).model_dump()
+    doc['updated_at'] = doc['updated_at'].isoformat()
+    deleted_progress.discard(doc['item_id'])
+    pending_progress[doc['item_id']] = doc
+    history_cache[doc['item_type']][doc['item_id']] = doc
+    trim_history_cache(doc['item_type'])
+    if len(pending_progress) >= HISTORY_FLUSH_MAX:
+        history_flush_wakeup.set()
+
+async def flush_progress():
+    global pending_progress, flushing_progress
+    if not pending_progress:
+        return
+    batch, pending_progress = pending_progress, {}
+    flushing_progress = batch
+    deleted_progress.clear()
+    try:
+        # Only overwrite older progress: another worker may already have
+        # flushed a newer position for the same item
+        await db.watch_history.bulk_write(
+            [
+                UpdateOne({"item_id": item_id, "updated_at": {"$lt": doc['updated_at']}}, {"$set": doc}, upsert=True)
+                for item_id, doc in batch.items()
+            ],
+            ordered=False
+        )
+    except BulkWriteError as e:
+        # A stale write finds no older document and its upsert collides with
+        # the newer one on the unique item_id index; that is the intended no-op
+        if any(error['code'] != 11000 for error in e.details['writeErrors']):
+            requeue_progress(batch)
+            raise
+    except BaseException:
+        # Includes the flusher being cancelled mid-write at shutdown
+        requeue_progress(batch)
+        raise
+    finally:
+        flushing_progress = {}
+    
+    revived = [item_id for item_id in batch if item_id in deleted_progress]
+    if revived:
+        await db.watch_history.delete_many({"item_id": {"$in": revived}})
+
+def requeue_progress(batch: dict):
+    # Put the batch back unless newer updates arrived meanwhile
+    for item_id, doc in batch.items():
+        if item_id not in deleted_progress:
+            pending_progress.setdefault(item_id, doc)
+
+async def history_flush_loop():
+    while True:
+        try:
+            await asyncio.wait_for(history_flush_wakeup.wait(), timeout=HISTORY_FLUSH_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        history_flush_wakeup.clear()
+        try:
+            await flush_progress()
+        except Exception:
+            logger.exception("Failed to flush watch history")
+
 # ============ ROUTES ============
 
 @api_router.get("/")
@@ -219,16 +1044,19 @@ async def get_playlists():
 
 @api_router.post("/playlists", response_model=Playlist)
 async def create_playlist(data: PlaylistCreate):
-    playlist = Playlist(name=data.name, url=data.url)
+    playlist = Playlist(name=data.name, url=data.url, refresh_interval=data.refresh_interval)
+    
+    progress = partial(publish_ingest_progress, playlist.id, playlist.name)
     
     # Fetch and parse M3U
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client_http:
-            response = await client_http.get(data.url)
-            response.raise_for_status()
-            content = response.text
-            
-        channels, vod_items, series_items = parse_m3u(content, playlist.id)
+        await progress("fetching")
+        content = await fetch_source(data.url)
+        channels, vod_items, series_items = await asyncio.to_thread(
+            parse_m3u, content.decode('utf-8', errors='replace'), playlist.id
+        )
+        await asyncio.to_thread(classify_items, await get_parental_rules(), channels, vod_items, series_items)
+        await progress("storing", channels=len(channels), vod=len(vod_items), series=len(series_items))
         
         # Store playlist
         doc = playlist.model_dump()
@@ -250,11 +1078,16 @@ async def create_playlist(data: PlaylistCreate):
             series_docs = [s.model_dump() for s in series_items]
             await db.series.insert_many(series_docs)
         
+        await reclassify_epg_for_channels(channels)
+        await progress("done", channels=len(channels), vod=len(vod_items), series=len(series_items))
+        await bump_catalog_version("playlist")
         return playlist
         
     except httpx.HTTPError as e:
+        await progress("error", error=str(e))
         raise HTTPException(status_code=400, detail=f"Failed to fetch M3U: {str(e)}")
     except Exception as e:
+        await progress("error", error=str(e))
         raise HTTPException(status_code=500, detail=f"Error processing playlist: {str(e)}")
 
 @api_router.delete("/playlists/{playlist_id}")
@@ -263,8 +1096,27 @@ async def delete_playlist(playlist_id: str):
     await db.channels.delete_many({"playlist_id": playlist_id})
     await db.vod.delete_many({"playlist_id": playlist_id})
     await db.series.delete_many({"playlist_id": playlist_id})
+    await db.scheduler_jobs.delete_one({"_id": playlist_job_id(playlist_id)})
+    await bump_catalog_version("playlist")
     return {"message": "Playlist deleted"}
 
+@api_router.post("/playlists/{playlist_id}/refresh")
+async def refresh_playlist_now(playlist_id: str):
+    if not SCHEDULER_ENABLED:
+        raise HTTPException(status_code=409, detail="Scheduler is disabled")
+    if not await db.playlists.find_one({"id": playlist_id}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Playlist not found")
+    
+    # Flag the job instead of fetching here, so the lease still guarantees
+    # a single refresh across workers
+    now = datetime.now(timezone.utc)
+    await db.scheduler_jobs.update_one(
+        {"_id": playlist_job_id(playlist_id)},
+        {"$set": {"refresh_requested": True}, "$setOnInsert": {"next_run_at": None, "lease_until": now, "failures": 0}},
+        upsert=True
+    )
+    return {"message": "Refresh scheduled"}
+
 # --- Channels ---
 
 @api_router.get("/channels", response_model=List[Channel])
@@ -277,12 +1129,23 @@ async def get_channels(group: Optional[str] = None, search: Optional[str] = None
     if radio is not None:
         query["is_radio"] = radio
     
+    query = await parental_query(query)
     channels = await db.channels.find(query, {"_id": 0}).to_list(1000)
     return channels
 
+@api_router.post("/channels/lookup", response_model=List[Channel])
+async def lookup_channels(data: ChannelIds):
+    check_id_limit(len(data.channel_ids))
+    
+    query = await parental_query({"id": {"$in": data.channel_ids}})
+    channels = await db.channels.find(query, {"_id": 0}).to_list(None)
+    # Return channels in the order they were requested
+    by_id = {c['id']: c for c in channels}
+    return [by_id[i] for i in dict.fromkeys(data.channel_ids) if i in by_id]
+
 @api_router.get("/channels/groups")
 async def get_channel_groups():
-    groups = await db.channels.distinct("group")
+    groups = await db.channels.distinct("group", await parental_query({}))
     return {"groups": groups}
 
 # --- VOD ---
@@ -295,12 +1158,13 @@ async def get_vod(category: Optional[str] = None, search: Optional[str] = None):
     if search:
         query["title"] = {"$regex": search, "$options": "i"}
     
+    query = await parental_query(query)
     items = await db.vod.find(query, {"_id": 0}).to_list(500)
     return items
 
 @api_router.get("/vod/categories")
 async def get_vod_categories():
-    categories = await db.vod.distinct("category")
+    categories = await db.vod.distinct("category", await parental_query({}))
     return {"categories": categories}
 
 # --- Series ---
@@ -313,38 +1177,184 @@ async def get_series(category: Optional[str] = None, search: Optional[str] = Non
     if search:
         query["title"] = {"$regex": search, "$options": "i"}
     
+    query = await parental_query(query)
     items = await db.series.find(query, {"_id": 0}).to_list(500)
     return items
 
 @api_router.get("/series/{series_id}")
 async def get_series_detail(series_id: str):
-    item = await db.series.find_one({"id": series_id}, {"_id": 0})
+    item = await db.series.find_one(await parental_query({"id": series_id}), {"_id": 0})
     if not item:
         raise HTTPException(status_code=404, detail="Series not found")
     return item
 
 # --- Favorites ---
 
-@api_router.get("/favorites", response_model=List[Favorite])
-async def get_favorites():
-    favorites = await db.favorites.find({}, {"_id": 0}).to_list(500)
+def favorite_doc(channel_id: str, channel_name: str, channel_url: Optional[str]) -> dict:
+    favorite = Favorite(channel_id=channel_id, channel_name=channel_name, channel_url=channel_url)
+    return {
+        "id": favorite.id,
+        "channel_id": favorite.channel_id,
+        "channel_name": favorite.channel_name,
+        "channel_url": favorite.channel_url,
+        "created_at": favorite.created_at.isoformat(),
+    }
+
+def check_id_limit(count: int, limit: int = CHANNEL_LOOKUP_MAX):
+    if count > limit:
+        raise HTTPException(status_code=400, detail=f"At most {limit} channel ids per request")
+
+async def resolve_favorites(favorites: List[dict]) -> List[dict]:
+    """Fill in channel details from the current channel documents.
+
+    Favorites whose channel is gone are re-linked to a channel with the same
+    stream URL (e.g. after a playlist was re-added), otherwise they are marked
+    unavailable and keep their stored name and URL.
+    """
+    ids = [f['channel_id'] for f in favorites]
+    channels = await db.channels.find({"id": {"$in": ids}}, {"_id": 0}).to_list(None)
+    by_id = {c['id']: c for c in channels}
+    
+    orphan_urls = [f['channel_url'] for f in favorites if f['channel_id'] not in by_id and f.get('channel_url')]
+    by_url = {}
+    if orphan_urls:
+        relinked = await db.channels.find({"url": {"$in": orphan_urls}}, {"_id": 0}).to_list(None)
+        by_url = {c['url']: c for c in relinked}
+    
+    relinks = []
+    favorited = set(ids)
     for f in favorites:
+        channel = by_id.get(f['channel_id'])
+        relinked = by_url.get(f.get('channel_url'))
+        if not channel and relinked and relinked['id'] not in favorited:
+            channel = relinked
+            favorited.add(channel['id'])
+            relinks.append(UpdateOne({"id": f['id']}, {"$set": {"channel_id": channel['id']}}))
+            f['channel_id'] = channel['id']
+        if channel:
+            f['channel_name'] = channel['name']
+            f['channel_url'] = channel['url']
+            f['channel_logo'] = channel.get('logo')
+            f['channel_group'] = channel.get('group')
+            f['restricted'] = channel.get('restricted', False)
+        else:
+            f['available'] = False
         if isinstance(f.get('created_at'), str):
             f['created_at'] = datetime.fromisoformat(f['created_at'])
+    
+    if relinks:
+        try:
+            await db.favorites.bulk_write(relinks, ordered=False)
+        except BulkWriteError:
+            # Another request favorited the channel under its new id meanwhile
+            logger.warning("Some favorites could not be re-linked")
+    return favorites
+
+async def dedupe_favorites():
+    """Keep the oldest favorite per channel so channel_id can be unique"""
+    duplicates = db.favorites.aggregate([
+        {"$sort": {"created_at": 1}},
+        {"$group": {"_id": "$channel_id", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ])
+    async for group in duplicates:
+        await db.favorites.delete_many({"_id": {"$in": group['ids'][1:]}})
+
+async def upsert_favorites(docs: List[dict]) -> int:
+    if not docs:
+        return 0
+    try:
+        result = await db.favorites.bulk_write(
+            [UpdateOne({"channel_id": d['channel_id']}, {"$setOnInsert": d}, upsert=True) for d in docs],
+            ordered=False
+        )
+    except BulkWriteError as e:
+        # Concurrent upserts of the same channel lose on the unique index
+        return e.details.get('nUpserted', 0)
+    return result.upserted_count
+
+@api_router.get("/favorites", response_model=List[Favorite])
+async def get_favorites():
+    favorites = await db.favorites.find({}, {"_id": 0}).to_list(500)
+    favorites = await resolve_favorites(favorites)
+    if await parental_enabled():
+        favorites = [f for f in favorites if not f.get('restricted')]
     return favorites
 
 @api_router.post("/favorites", response_model=Favorite)
 async def add_favorite(data: FavoriteCreate):
-    # Check if already favorite
-    existing = await db.favorites.find_one({"channel_id": data.channel_id})
-    if existing:
+    doc = favorite_doc(data.channel_id, data.channel_name, data.channel_url)
+    try:
+        result = await db.favorites.update_one(
+            {"channel_id": data.channel_id},
+            {"$setOnInsert": doc},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        result = None
+    if result is None or result.upserted_id is None:
         raise HTTPException(status_code=400, detail="Already in favorites")
     
-    favorite = Favorite(**data.model_dump())
-    doc = favorite.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
-    await db.favorites.insert_one(doc)
-    return favorite
+    favorites = await resolve_favorites([doc])
+    return favorites[0]
+
+@api_router.post("/favorites/bulk-add")
+async def add_favorites(data: ChannelIds):
+    check_id_limit(len(data.channel_ids), FAVORITES_BATCH_MAX)
+    channels = await db.channels.find(
+        {"id": {"$in": data.channel_ids}}, {"_id": 0, "id": 1, "name": 1, "url": 1}
+    ).to_list(None)
+    added = await upsert_favorites([favorite_doc(c['id'], c['name'], c['url']) for c in channels])
+    return {"added": added, "not_found": len(set(data.channel_ids)) - len(channels)}
+
+@api_router.post("/favorites/bulk-remove")
+async def remove_favorites(data: ChannelIds):
+    check_id_limit(len(data.channel_ids), FAVORITES_BATCH_MAX)
+    result = await db.favorites.delete_many({"channel_id": {"$in": data.channel_ids}})
+    return {"removed": result.deleted_count}
+
+@api_router.get("/favorites/export")
+async def export_favorites():
+    favorites = await db.favorites.find({}, {"_id": 0}).to_list(None)
+    favorites = await resolve_favorites(favorites)
+    if await parental_enabled():
+        favorites = [f for f in favorites if not f.get('restricted')]
+    return {
+        "favorites": [
+            FavoriteCreate(**f).model_dump() for f in favorites
+        ]
+    }
+
+@api_router.post("/favorites/import")
+async def import_favorites(data: FavoritesImport):
+    check_id_limit(len(data.favorites), FAVORITES_BATCH_MAX)
+    # Match on channel id first, then on stream URL for exports taken from
+    # another instance or before a playlist was re-added. Channels are looked
+    # up in lookup-sized batches to keep each query small.
+    by_id = {}
+    by_url = {}
+    for i in range(0, len(data.favorites), CHANNEL_LOOKUP_MAX):
+        batch = data.favorites[i:i + CHANNEL_LOOKUP_MAX]
+        ids = [f.channel_id for f in batch]
+        urls = [f.channel_url for f in batch if f.channel_url]
+        channels = await db.channels.find(
+            {"$or": [{"id": {"$in": ids}}, {"url": {"$in": urls}}]},
+            {"_id": 0, "id": 1, "name": 1, "url": 1}
+        ).to_list(None)
+        by_id.update((c['id'], c) for c in channels)
+        by_url.update((c['url'], c) for c in channels)
+    
+    docs = {}
+    unmatched = 0
+    for f in data.favorites:
+        channel = by_id.get(f.channel_id) or by_url.get(f.channel_url)
+        if not channel:
+            unmatched += 1
+            continue
+        docs[channel['id']] = favorite_doc(channel['id'], channel['name'], channel['url'])
+    
+    imported = await upsert_favorites(list(docs.values()))
+    return {"imported": imported, "unmatched": unmatched}
 
 @api_router.delete("/favorites/{channel_id}")
 async def remove_favorite(channel_id: str):
@@ -365,11 +1375,26 @@ async def get_settings():
 
 @api_router.put("/settings", response_model=Settings)
 async def update_settings(data: Settings):
+    current = Settings(**(await db.settings.find_one({"id": "default"}, {"_id": 0}) or {}))
+    if data.epg_url != current.epg_url:
+        # Fetch the new guide on the next scheduler tick
+        await db.scheduler_jobs.update_one({"_id": "epg"}, {"$set": {"refresh_requested": True}})
+    
     await db.settings.update_one(
         {"id": "default"},
         {"$set": data.model_dump()},
         upsert=True
     )
+    
+    rules_changed = (
+        data.parental_keywords != current.parental_keywords
+        or data.parental_groups != current.parental_groups
+    )
+    if rules_changed:
+        schedule_reclassification()
+    if data.parental_control != current.parental_control:
+        # Catalog endpoints now return a different set of items
+        await bump_catalog_version("parental")
     return data
 
 # --- Recordings ---
@@ -411,17 +1436,38 @@ async def get_messages():
             m['created_at'] = datetime.fromisoformat(m['created_at'])
     return messages
 
+@api_router.post("/messages", response_model=Message)
+async def create_message(data: MessageCreate):
+    message = Message(**data.model_dump())
+    doc = message.model_dump()
+    doc['created_at'] = doc['created_at'].isoformat()
+    await db.messages.insert_one(doc)
+    doc.pop('_id', None)
+    await publish_event("message", doc)
+    return message
+
 @api_router.post("/messages/read/{message_id}")
 async def mark_message_read(message_id: str):
     await db.messages.update_one({"id": message_id}, {"$set": {"read": True}})
     return {"message": "Marked as read"}
 
-# --- EPG (Mock) ---
+# --- EPG ---
 
 @api_router.get("/epg")
 async def get_epg(channel_id: Optional[str] = None):
-    # Return mock EPG data
     now = datetime.now(timezone.utc)
+    
+    # Serve the guide fetched by the scheduler from Settings.epg_url. The last
+    # programme of a channel may have no end time.
+    query = {"$or": [{"end": {"$gte": now.isoformat()}}, {"end": None}]}
+    if channel_id:
+        query["channel_id"] = channel_id
+    query = await parental_query(query)
+    programs = await db.epg.find(query, {"_id": 0, "version": 0}).sort("start", 1).to_list(500)
+    if programs:
+        return {"programs": programs}
+    
+    # Fall back to mock EPG data
     programs = [
         {
             "id": "1",
@@ -466,6 +1512,76 @@ async def get_epg(channel_id: Optional[str] = None):
     ]
     return {"programs": programs}
 
+# --- Watch History ---
+
+@api_router.post("/history/progress")
+async def update_progress(data: WatchProgressUpdate):
+    record_progress(data)
+    return {"message": "Progress recorded"}
+
+async def without_restricted(items: List[dict], limit: int) -> List[dict]:
+    if await parental_enabled():
+        restricted = await restricted_item_ids(items)
+        items = [i for i in items if i['item_id'] not in restricted]
+    return items[:limit]
+
+@api_router.get("/history/continue", response_model=List[WatchProgress])
+async def get_continue_watching(limit: int = 20):
+    items = []
+    for doc in await get_history_cache("vod", "series"):
+        if not doc['position']:
+            continue
+        if doc.get('duration') and doc['position'] >= doc['duration'] * HISTORY_FINISHED_RATIO:
+            continue
+        items.append(doc)
+    return await without_restricted(items, limit)
+
+@api_router.get("/history/channels", response_model=List[WatchProgress])
+async def get_recent_channels(limit: int = 20):
+    items = await get_history_cache("channel")
+    return await without_restricted(items, limit)
+
+@api_router.delete("/history/{item_id}")
+async def delete_history_item(item_id: str):
+    pending_progress.pop(item_id, None)
+    for cache in history_cache.values():
+        cache.pop(item_id, None)
+    deleted_progress.add(item_id)
+    await db.watch_history.delete_one({"item_id": item_id})
+    return {"message": "Removed from history"}
+
+# --- Events ---
+
+@api_router.get("/events")
+async def stream_events():
+    # Subscribe before reading the version so a bump in between is queued
+    queue = asyncio.Queue(maxsize=EVENTS_QUEUE_SIZE)
+    event_subscribers.add(queue)
+    try:
+        version = await get_catalog_version()
+    except Exception:
+        event_subscribers.discard(queue)
+        raise
+    
+    async def stream():
+        try:
+            # Let the client compare against the version it last loaded
+            yield "retry: 5000\n\n" + format_sse("catalog", {"version": version})
+            while True:
+                yield await queue.get()
+        finally:
+            event_subscribers.discard(queue)
+    
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@api_router.get("/catalog/version")
+async def catalog_version():
+    return {"version": await get_catalog_version()}
+
 # --- App Info ---
 
 @api_router.get("/version")
@@ -495,6 +1611,72 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def ensure_indexes():
+    for collection in (db.channels, db.vod, db.series):
+        await collection.create_index("id")
+        await collection.create_index("playlist_id")
+    await db.epg.create_index([("channel_id", 1), ("start", 1)])
+    await db.epg.create_index("end")
+    await db.epg.create_index([("restricted", 1), ("end", 1)])
+    await db.channels.create_index([("restricted", 1), ("is_radio", 1), ("group", 1)])
+    await db.channels.create_index([("restricted", 1), ("tvg_id", 1)])
+    await db.vod.create_index([("restricted", 1), ("category", 1)])
+    await db.series.create_index([("restricted", 1), ("category", 1)])
+    await db.watch_history.create_index("item_id", unique=True)
+    await db.watch_history.create_index([("item_type", 1), ("updated_at", -1)])
+    await dedupe_favorites()
+    await db.favorites.create_index("channel_id", unique=True)
+    await db.channels.create_index("url")
+
+@app.on_event("startup")
+async def classify_existing_catalog():
+    # Items ingested before parental classification existed have no flag yet
+    if await has_unclassified_items():
+        schedule_reclassification(only_unclassified=True)
+
+@app.on_event("startup")
+async def start_scheduler():
+    if SCHEDULER_ENABLED:
+        task = asyncio.create_task(scheduler_loop())
+        scheduler_tasks.add(task)
+        logger.info(f"Refresh scheduler started on worker {WORKER_ID}")
+
+@app.on_event("shutdown")
+async def stop_scheduler():
+    # Unfinished jobs keep their lease until it expires, then another worker retries them
+    for task in list(scheduler_tasks):
+        task.cancel()
+    await asyncio.gather(*scheduler_tasks, return_exceptions=True)
+
+@app.on_event("startup")
+async def start_history_flusher():
+    task = asyncio.create_task(history_flush_loop())
+    history_tasks.add(task)
+
+@app.on_event("shutdown")
+async def flush_watch_history():
+    for task in list(history_tasks):
+        task.cancel()
+    await asyncio.gather(*history_tasks, return_exceptions=True)
+    try:
+        await flush_progress()
+    except Exception:
+        logger.exception("Failed to flush watch history on shutdown")
+
+@app.on_event("startup")
+async def start_event_relay():
+    await ensure_event_log()
+    for loop in (event_tail_loop, event_heartbeat_loop):
+        task = asyncio.create_task(loop())
+        event_tasks.add(task)
+
+@app.on_event("shutdown")
+async def stop_event_relay():
+    for task in list(event_tasks):
+        task.cancel()
+    await asyncio.gather(*event_tasks, return_exceptions=True)
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
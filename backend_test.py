@@ -85,6 +85,9 @@ class IPTVAPITester:
         }
         playlist_success, playlist_data = self.run_test("Create Playlist", "POST", "playlists", 400, test_playlist)
         
+        # Manual refresh of an unknown playlist
+        self.run_test("Refresh Missing Playlist", "POST", "playlists/test-id/refresh", 404)
+        
         return success
 
     def test_channels_endpoints(self):
@@ -103,7 +106,14 @@ class IPTVAPITester:
         # Search channels
         success4, search_results = self.run_test("Search Channels", "GET", "channels", 200, params={"search": "test"})
         
-        return success1 and success2 and success3 and success4
+        # Look up channels by id
+        success5, lookup = self.run_test("Lookup Channels", "POST", "channels/lookup", 200, {"channel_ids": ["test-channel-id"]})
+        
+        # Lookups above the limit are rejected
+        too_many = {"channel_ids": [f"id-{i}" for i in range(201)]}
+        success6, _ = self.run_test("Lookup Too Many Channels", "POST", "channels/lookup", 400, too_many)
+        
+        return success1 and success2 and success3 and success4 and success5 and success6
 
     def test_vod_endpoints(self):
         """Test VOD endpoints"""
@@ -149,7 +159,21 @@ class IPTVAPITester:
         }
         success2, add_result = self.run_test("Add Favorite", "POST", "favorites", 400, test_favorite)
         
-        return success1
+        # Bulk add/remove (unknown ids are reported, not added)
+        ids = {"channel_ids": ["missing-channel-id"]}
+        success3, _ = self.run_test("Bulk Add Favorites", "POST", "favorites/bulk-add", 200, ids)
+        success4, _ = self.run_test("Bulk Remove Favorites", "POST", "favorites/bulk-remove", 200, ids)
+        
+        # Export and re-import
+        success5, exported = self.run_test("Export Favorites", "GET", "favorites/export", 200)
+        success6, _ = self.run_test("Import Favorites", "POST", "favorites/import", 200,
+                                    {"favorites": exported.get("favorites", [])})
+        
+        # Imports are not held to the channel lookup limit
+        many = {"favorites": [{"channel_id": f"id-{i}", "channel_name": f"Channel {i}"} for i in range(201)]}
+        success7, _ = self.run_test("Import Many Favorites", "POST", "favorites/import", 200, many)
+        
+        return success1 and success3 and success4 and success5 and success6 and success7
 
     def test_settings_endpoints(self):
         """Test Settings endpoints"""
@@ -197,7 +221,66 @@ class IPTVAPITester:
         # Try to mark a message as read (might fail if no messages exist)
         success2, mark_read = self.run_test("Mark Message Read", "POST", "messages/read/test-id", 200)
         
-        return success1
+        # Create a message
+        test_message = {"title": "Test", "content": "Test message", "type": "info"}
+        success3, created = self.run_test("Create Message", "POST", "messages", 200, test_message)
+        
+        return success1 and success3
+
+    def test_history_endpoints(self):
+        """Test Watch History endpoints"""
+        print("\n🕒 Testing Watch History Endpoints...")
+        
+        progress = {
+            "item_id": "test-vod-id",
+            "item_type": "vod",
+            "title": "Test Movie",
+            "position": 120,
+            "duration": 5400
+        }
+        success1, _ = self.run_test("Record Progress", "POST", "history/progress", 200, progress)
+        
+        # Unknown item types are rejected
+        success2, _ = self.run_test("Record Invalid Progress", "POST", "history/progress", 422,
+                                    {**progress, "item_type": "movie"})
+        
+        success3, _ = self.run_test("Continue Watching", "GET", "history/continue", 200)
+        success4, _ = self.run_test("Recent Channels", "GET", "history/channels", 200)
+        success5, _ = self.run_test("Delete History Item", "DELETE", "history/test-vod-id", 200)
+        
+        return success1 and success2 and success3 and success4 and success5
+
+    def test_events_endpoints(self):
+        """Test catalog version and the SSE stream"""
+        print("\n📣 Testing Events Endpoints...")
+        
+        success1, version = self.run_test("Get Catalog Version", "GET", "catalog/version", 200)
+        
+        # The stream never ends, so only read its first event
+        self.tests_run += 1
+        print("\n🔍 Testing Events Stream...")
+        try:
+            with requests.get(f"{self.base_url}/events", stream=True, timeout=10) as response:
+                lines = response.iter_lines(decode_unicode=True)
+                first_event = [next(lines) for _ in range(3)]
+            success2 = response.status_code == 200 and "event: catalog" in first_event
+        except Exception as e:
+            print(f"❌ Failed - Error: {str(e)}")
+            success2 = False
+        if success2:
+            self.tests_passed += 1
+            print("✅ Passed - received catalog event")
+        self.test_results.append({
+            "name": "Events Stream",
+            "method": "GET",
+            "endpoint": "events",
+            "expected_status": 200,
+            "actual_status": 200 if success2 else "ERROR",
+            "success": success2,
+            "response_preview": "OK" if success2 else "No catalog event"
+        })
+        
+        return success1 and success2
 
     def test_recordings_endpoints(self):
         """Test Recordings endpoints"""
@@ -232,6 +315,8 @@ def main():
         tester.test_epg_endpoint,
         tester.test_messages_endpoints,
         tester.test_recordings_endpoints,
+        tester.test_history_endpoints,
+        tester.test_events_endpoints,
         tester.test_version_endpoint
     ]
     
@@ -148,7 +148,9 @@ export default function Favorites() {
 
                 <div className="flex-1 min-w-0">
                   <h3 className="font-semibold truncate">{favorite.channel_name}</h3>
-                  <p className="text-sm text-white/50">{favorite.channel_group || "General"}</p>
+                  <p className="text-sm text-white/50">
+                    {favorite.available === false ? "No disponible" : favorite.channel_group || "General"}
+                  </p>
                 </div>
 
                 <div className="flex items-center gap-2">
@@ -156,6 +158,7 @@ export default function Favorites() {
                     variant="default"
                     size="sm"
                     onClick={() => handlePlay(favorite)}
+                    disabled={!favorite.channel_url}
                     className="gap-2"
                   >
                     <Play size={16} />
@@ -105,14 +105,20 @@ export default function Home() {
   const [loading, setLoading] = useState(true);
 
   useEffect(() => {
+    let catalogVersion = null;
+
+    const fetchChannels = async () => {
+      const channelsRes = await axios.get(`${API}/channels`);
+      setChannelCount(channelsRes.data.length);
+    };
+
     const fetchData = async () => {
       try {
-        const [messagesRes, channelsRes] = await Promise.all([
-          axios.get(`${API}/messages`),
-          axios.get(`${API}/channels`),
-        ]);
+        const messagesRequest = axios.get(`${API}/messages`);
+        const channelsRequest = fetchChannels().catch(error => console.error("Error fetching channels:", error));
+        const messagesRes = await messagesRequest;
         setMessageCount(messagesRes.data.filter(m => !m.read).length);
-        setChannelCount(channelsRes.data.length);
+        await channelsRequest;
       } catch (error) {
         console.error("Error fetching data:", error);
       } finally {
@@ -120,6 +126,21 @@ export default function Home() {
       }
     };
     fetchData();
+
+    // Push updates instead of polling; refetch channels only when the catalog changes
+    const events = new EventSource(`${API}/events`);
+    events.addEventListener("message", (e) => {
+      const message = JSON.parse(e.data);
+      if (!message.read) setMessageCount(count => count + 1);
+    });
+    events.addEventListener("catalog", (e) => {
+      const { version } = JSON.parse(e.data);
+      if (catalogVersion !== null && version !== catalogVersion) {
+        fetchChannels().catch(error => console.error("Error fetching channels:", error));
+      }
+      catalogVersion = version;
+    });
+    return () => events.close();
   }, []);
 
   const checkForUpdates = async () => {
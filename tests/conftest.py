@@ -0,0 +1,28 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "iptv_test")
+
+import server  # noqa: E402
+from unittest.mock import AsyncMock, MagicMock  # noqa: E402
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    """Replace the Mongo database with mocks whose collection methods are awaitable"""
+    db = MagicMock()
+    for collection in ("scheduler_jobs", "scheduler_slots", "watch_history", "settings",
+                       "favorites", "channels"):
+        mock = getattr(db, collection)
+        for method in ("find_one", "find_one_and_update", "update_one", "update_many",
+                       "bulk_write", "delete_one", "delete_many", "distinct"):
+            setattr(mock, method, AsyncMock())
+        # find() returns a cursor; set side_effect on to_list for several queries
+        mock.find.return_value.to_list = AsyncMock(return_value=[])
+    monkeypatch.setattr(server, "db", db)
+    return db
@@ -0,0 +1,49 @@
+from datetime import datetime, timezone
+
+import server
+
+
+def test_parse_xmltv_time_with_offset():
+    parsed = server.parse_xmltv_time("20260101120000 +0200")
+    assert parsed == datetime(2026, 1, 1, 10, 0, tzinfo=timezone.utc)
+
+
+def test_parse_xmltv_time_without_offset_is_utc():
+    parsed = server.parse_xmltv_time("20260101120000")
+    assert parsed == datetime(2026, 1, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def test_parse_xmltv_time_invalid():
+    assert server.parse_xmltv_time("not a time") is None
+    assert server.parse_xmltv_time(None) is None
+
+
+def test_parse_xmltv_programmes():
+    content = b"""<?xml version="1.0" encoding="UTF-8"?>
+<tv>
+  <channel id="news"><display-name>News</display-name></channel>
+  <programme start="20260101120000 +0000" stop="20260101130000 +0000" channel="news">
+    <title>Noon</title><desc>Headlines</desc>
+  </programme>
+  <programme start="bogus" channel="news"><title>Skipped</title></programme>
+</tv>"""
+    programs = server.parse_xmltv(content)
+    assert len(programs) == 1
+    program = programs[0]
+    assert program["channel_id"] == "news"
+    assert program["title"] == "Noon"
+    assert program["description"] == "Headlines"
+    assert program["start"] == "2026-01-01T12:00:00+00:00"
+    assert program["end"] == "2026-01-01T13:00:00+00:00"
+
+
+def test_parse_xmltv_fills_missing_stop_from_next_programme():
+    content = b"""<tv>
+  <programme start="20260101130000 +0000" channel="a"><title>Second</title></programme>
+  <programme start="20260101120000 +0000" channel="a"><title>First</title></programme>
+  <programme start="20260101123000 +0000" channel="b"><title>Other</title></programme>
+</tv>"""
+    programs = {p["title"]: p for p in server.parse_xmltv(content)}
+    assert programs["First"]["end"] == programs["Second"]["start"]
+    assert programs["Second"]["end"] is None
+    assert programs["Other"]["end"] is None
@@ -0,0 +1,52 @@
+import asyncio
+
+import pytest
+
+import server
+
+
+@pytest.fixture(autouse=True)
+def subscribers(monkeypatch):
+    monkeypatch.setattr(server, "event_subscribers", set())
+
+
+def test_format_sse():
+    assert server.format_sse("catalog", {"version": 2}) == 'event: catalog\ndata: {"version": 2}\n\n'
+
+
+def test_dispatch_reaches_every_subscriber():
+    queues = [asyncio.Queue(maxsize=5) for _ in range(3)]
+    server.event_subscribers.update(queues)
+    server.dispatch_event("event")
+    assert all(q.get_nowait() == "event" for q in queues)
+
+
+def test_full_queue_drops_oldest_event():
+    queue = asyncio.Queue(maxsize=2)
+    server.event_subscribers.add(queue)
+    for message in ("first", "second", "third"):
+        server.dispatch_event(message)
+
+    assert queue.qsize() == 2
+    assert [queue.get_nowait(), queue.get_nowait()] == ["second", "third"]
+
+
+def test_stream_subscribes_before_reading_catalog_version(monkeypatch):
+    async def version_with_bump():
+        # A bump published while the version is read must reach the client
+        server.dispatch_event(server.format_sse("catalog", {"version": 8}))
+        return 7
+
+    monkeypatch.setattr(server, "get_catalog_version", version_with_bump)
+
+    async def first_two_messages():
+        response = await server.stream_events()
+        stream = response.body_iterator
+        messages = [await stream.__anext__(), await stream.__anext__()]
+        await stream.aclose()
+        return messages
+
+    first, second = asyncio.run(first_two_messages())
+    assert '"version": 7' in first
+    assert '"version": 8' in second
+    assert not server.event_subscribers
@@ -0,0 +1,134 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from pymongo.errors import BulkWriteError
+
+import server
+
+
+def favorite(channel_id, url=None, **extra):
+    return {"id": f"fav-{channel_id}", "channel_id": channel_id, "channel_name": "Old name",
+            "channel_url": url, "created_at": "2026-01-01T00:00:00+00:00", **extra}
+
+
+def channel(channel_id, url, name="Channel", **extra):
+    return {"id": channel_id, "name": name, "url": url, **extra}
+
+
+def test_favorites_are_filled_from_current_channels(fake_db):
+    fake_db.channels.find.return_value.to_list.side_effect = [
+        [channel("c1", "http://one", name="Current name", restricted=True)],
+    ]
+
+    [resolved] = asyncio.run(server.resolve_favorites([favorite("c1", "http://one")]))
+
+    assert resolved["channel_name"] == "Current name"
+    assert resolved["restricted"] is True
+    assert "available" not in resolved
+    fake_db.favorites.bulk_write.assert_not_awaited()
+
+
+def test_orphaned_favorite_is_relinked_by_url(fake_db):
+    fake_db.channels.find.return_value.to_list.side_effect = [
+        [],
+        [channel("new-id", "http://one", name="Re-added")],
+    ]
+
+    [resolved] = asyncio.run(server.resolve_favorites([favorite("old-id", "http://one")]))
+
+    assert resolved["channel_id"] == "new-id"
+    assert resolved["channel_name"] == "Re-added"
+    [op] = fake_db.favorites.bulk_write.call_args.args[0]
+    assert op._filter == {"id": "fav-old-id"}
+    assert op._doc == {"$set": {"channel_id": "new-id"}}
+
+
+def test_orphaned_favorite_without_match_is_unavailable(fake_db):
+    fake_db.channels.find.return_value.to_list.side_effect = [[], []]
+
+    [resolved] = asyncio.run(server.resolve_favorites([favorite("gone", "http://gone")]))
+
+    assert resolved["available"] is False
+    assert resolved["channel_name"] == "Old name"
+    assert resolved["channel_url"] == "http://gone"
+    fake_db.favorites.bulk_write.assert_not_awaited()
+
+
+def test_orphan_is_not_relinked_onto_an_existing_favorite(fake_db):
+    fake_db.channels.find.return_value.to_list.side_effect = [
+        [channel("c1", "http://one")],
+        [channel("c1", "http://one")],
+    ]
+    favorites = [favorite("c1", "http://one"), favorite("old-id", "http://one")]
+
+    resolved = asyncio.run(server.resolve_favorites(favorites))
+
+    assert resolved[1]["available"] is False
+    fake_db.favorites.bulk_write.assert_not_awaited()
+
+
+def test_upsert_counts_only_inserted_favorites(fake_db):
+    fake_db.favorites.bulk_write.return_value.upserted_count = 2
+    docs = [server.favorite_doc(f"c{i}", "Channel", "http://x") for i in range(3)]
+
+    assert asyncio.run(server.upsert_favorites(docs)) == 2
+
+    ops = fake_db.favorites.bulk_write.call_args.args[0]
+    assert [op._filter for op in ops] == [{"channel_id": f"c{i}"} for i in range(3)]
+    assert all(op._upsert for op in ops)
+
+
+def test_upsert_ignores_concurrent_duplicates(fake_db):
+    fake_db.favorites.bulk_write.side_effect = BulkWriteError(
+        {"nUpserted": 1, "writeErrors": [{"index": 1, "code": 11000}]}
+    )
+    docs = [server.favorite_doc(f"c{i}", "Channel", "http://x") for i in range(2)]
+
+    assert asyncio.run(server.upsert_favorites(docs)) == 1
+
+
+def test_upsert_without_docs_does_not_write(fake_db):
+    assert asyncio.run(server.upsert_favorites([])) == 0
+    fake_db.favorites.bulk_write.assert_not_awaited()
+
+
+def test_import_matches_by_id_then_url(fake_db):
+    fake_db.channels.find.return_value.to_list.side_effect = [
+        [channel("c1", "http://one", name="One"), channel("c2", "http://two", name="Two")],
+    ]
+    fake_db.favorites.bulk_write.return_value.upserted_count = 2
+    data = server.FavoritesImport(favorites=[
+        server.FavoriteCreate(channel_id="c1", channel_name="One"),
+        server.FavoriteCreate(channel_id="elsewhere", channel_name="Two", channel_url="http://two"),
+        server.FavoriteCreate(channel_id="gone", channel_name="Gone", channel_url="http://gone"),
+    ])
+
+    result = asyncio.run(server.import_favorites(data))
+
+    assert result == {"imported": 2, "unmatched": 1}
+    ops = fake_db.favorites.bulk_write.call_args.args[0]
+    assert sorted(op._filter["channel_id"] for op in ops) == ["c1", "c2"]
+
+
+def test_import_accepts_more_than_the_lookup_limit(fake_db, monkeypatch):
+    monkeypatch.setattr(server, "CHANNEL_LOOKUP_MAX", 2)
+    data = server.FavoritesImport(favorites=[
+        server.FavoriteCreate(channel_id=f"c{i}", channel_name="Channel") for i in range(5)
+    ])
+
+    result = asyncio.run(server.import_favorites(data))
+
+    assert result == {"imported": 0, "unmatched": 5}
+    assert fake_db.channels.find.call_count == 3
+
+
+def test_import_above_the_favorites_limit_is_rejected(fake_db, monkeypatch):
+    monkeypatch.setattr(server, "FAVORITES_BATCH_MAX", 2)
+    data = server.FavoritesImport(favorites=[
+        server.FavoriteCreate(channel_id=f"c{i}", channel_name="Channel") for i in range(3)
+    ])
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(server.import_favorites(data))
+    assert error.value.status_code == 400
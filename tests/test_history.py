@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+from pydantic import ValidationError
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+import server
+
+
+@pytest.fixture(autouse=True)
+def history_state(monkeypatch):
+    monkeypatch.setattr(server, "pending_progress", {})
+    monkeypatch.setattr(server, "flushing_progress", {})
+    monkeypatch.setattr(server, "deleted_progress", set())
+    monkeypatch.setattr(server, "history_cache", {t: {} for t in server.WATCH_ITEM_TYPES})
+
+
+def update(item_id="movie", position=10.0, item_type="vod", **extra):
+    return server.WatchProgressUpdate(item_id=item_id, item_type=item_type, title="Movie", position=position, **extra)
+
+
+def written_ops(fake_db):
+    return fake_db.watch_history.bulk_write.call_args.args[0]
+
+
+def test_progress_updates_are_coalesced_per_item(fake_db):
+    server.record_progress(update(position=10))
+    server.record_progress(update(position=20))
+    server.record_progress(update(item_id="other", position=5))
+    asyncio.run(server.flush_progress())
+
+    ops = written_ops(fake_db)
+    assert len(ops) == 2
+    positions = {op._filter["item_id"]: op._doc["$set"]["position"] for op in ops}
+    assert positions == {"movie": 20, "other": 5}
+    assert server.pending_progress == {}
+
+
+def test_flush_without_updates_does_not_write(fake_db):
+    asyncio.run(server.flush_progress())
+    fake_db.watch_history.bulk_write.assert_not_awaited()
+
+
+def test_failed_flush_keeps_batch_pending(fake_db):
+    fake_db.watch_history.bulk_write.side_effect = AutoReconnect("down")
+    server.record_progress(update(position=10))
+    with pytest.raises(AutoReconnect):
+        asyncio.run(server.flush_progress())
+    assert server.pending_progress["movie"]["position"] == 10
+
+
+def test_delete_during_flush_is_reapplied(fake_db):
+    async def delete_while_writing(ops, ordered):
+        server.deleted_progress.add("movie")
+
+    fake_db.watch_history.bulk_write.side_effect = delete_while_writing
+    server.record_progress(update())
+    asyncio.run(server.flush_progress())
+
+    fake_db.watch_history.delete_many.assert_awaited_once_with({"item_id": {"$in": ["movie"]}})
+
+
+def test_progress_update_validation():
+    with pytest.raises(ValidationError):
+        server.WatchProgressUpdate(item_id="x", item_type="movie", title="Typo")
+    with pytest.raises(ValidationError):
+        update(position=-1)
+
+
+def test_flush_only_overwrites_older_progress(fake_db):
+    server.record_progress(update())
+    asyncio.run(server.flush_progress())
+
+    op = written_ops(fake_db)[0]
+    doc = op._doc["$set"]
+    assert op._filter == {"item_id": "movie", "updated_at": {"$lt": doc["updated_at"]}}
+    assert op._upsert
+
+
+def test_stale_flush_losing_to_newer_write_is_a_no_op(fake_db):
+    fake_db.watch_history.bulk_write.side_effect = BulkWriteError(
+        {"writeErrors": [{"index": 0, "code": 11000, "errmsg": "duplicate key"}]}
+    )
+    server.record_progress(update())
+    asyncio.run(server.flush_progress())
+    assert server.pending_progress == {}
+
+
+def test_channel_zapping_does_not_evict_vod_progress(monkeypatch):
+    monkeypatch.setattr(server, "HISTORY_CACHE_SIZE", 3)
+    server.record_progress(update(item_id="movie", position=30))
+    for i in range(10):
+        server.record_progress(update(item_id=f"channel-{i}", item_type="channel"))
+
+    assert list(server.history_cache["vod"]) == ["movie"]
+    assert len(server.history_cache["channel"]) == 3
@@ -0,0 +1,70 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import server
+
+
+def default_rules(groups=()):
+    return server.compile_parental_rules(tuple(server.DEFAULT_PARENTAL_KEYWORDS), tuple(groups))
+
+
+def test_keywords_match_whole_words():
+    rules = default_rules()
+    assert server.is_restricted("Canal XXX", None, rules)
+    assert server.is_restricted("Peliculas +18", "Cine", rules)
+    assert server.is_restricted("Cine", "Adultos", rules)
+    assert not server.is_restricted("Sexxxy Hits", None, rules)
+
+
+def test_default_keywords_do_not_hide_kids_content():
+    assert not server.is_restricted("Adult Swim", "Kids", default_rules())
+
+
+def test_keywords_are_case_insensitive():
+    rules = server.compile_parental_rules(("late night",), ())
+    assert server.is_restricted("LATE NIGHT Show", None, rules)
+
+
+def test_group_rules_match_exact_group():
+    rules = default_rules(groups=("after hours",))
+    assert server.is_restricted("News", "After Hours", rules)
+    assert not server.is_restricted("News", "After Hours Extra", rules)
+
+
+def test_empty_rules_restrict_nothing():
+    rules = server.compile_parental_rules((), ())
+    assert not server.is_restricted("XXX", "Adultos", rules)
+
+
+def test_rules_are_compiled_once():
+    assert default_rules() is default_rules()
+
+
+def test_ingest_reclassifies_guide_of_ingested_channels(monkeypatch):
+    reclassify = AsyncMock()
+    monkeypatch.setattr(server, "db", MagicMock())
+    monkeypatch.setattr(server, "reclassify_collection", reclassify)
+    monkeypatch.setattr(server, "get_parental_rules", AsyncMock(return_value=default_rules()))
+    monkeypatch.setattr(server, "restricted_epg_channels", AsyncMock(return_value={"adult.tv"}))
+    channels = [
+        server.Channel(playlist_id="p", name="Canal XXX", url="http://a", tvg_id="adult.tv", restricted=True),
+        server.Channel(playlist_id="p", name="News", url="http://b", tvg_id="news.tv"),
+        server.Channel(playlist_id="p", name="No guide", url="http://c"),
+    ]
+
+    asyncio.run(server.reclassify_epg_for_channels(channels))
+
+    collection, title_field, group_field, rules, query, restricted = reclassify.await_args.args
+    assert collection is server.db.epg
+    assert sorted(query["channel_id"]["$in"]) == ["adult.tv", "news.tv"]
+    assert restricted == {"adult.tv"}
+
+
+def test_ingest_without_guide_ids_skips_reclassification(monkeypatch):
+    reclassify = AsyncMock()
+    monkeypatch.setattr(server, "reclassify_collection", reclassify)
+    channels = [server.Channel(playlist_id="p", name="News", url="http://b")]
+
+    asyncio.run(server.reclassify_epg_for_channels(channels))
+
+    reclassify.assert_not_awaited()
@@ -0,0 +1,72 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock
+
+import pytest
+
+import server
+
+
+@pytest.fixture(autouse=True)
+def no_jitter(monkeypatch):
+    monkeypatch.setattr(server, "SCHEDULER_JITTER", 0)
+    monkeypatch.setattr(server, "SCHEDULER_BACKOFF_SECONDS", 300)
+
+
+def test_next_delay_backs_off_up_to_interval():
+    assert server.next_delay(3600, 0) == 3600
+    assert server.next_delay(3600, 1) == 300
+    assert server.next_delay(3600, 2) == 600
+    assert server.next_delay(3600, 5) == 3600
+    assert server.next_delay(None, 3) is None
+
+
+def test_claim_job_requires_due_and_unleased(fake_db):
+    fake_db.scheduler_jobs.find_one_and_update.return_value = {"_id": "epg"}
+    assert asyncio.run(server.claim_job("epg"))
+
+    query, update = fake_db.scheduler_jobs.find_one_and_update.call_args.args
+    assert query["_id"] == "epg"
+    assert "lease_until" in query
+    assert {"refresh_requested": True} in query["$or"]
+    assert update["$set"]["owner"] == server.WORKER_ID
+    assert update["$set"]["refresh_requested"] is False
+
+    fake_db.scheduler_jobs.find_one_and_update.return_value = None
+    assert not asyncio.run(server.claim_job("epg"))
+
+
+def recorded_fields(fake_db):
+    query, update = fake_db.scheduler_jobs.update_one.call_args.args
+    assert query == {"_id": "job", "owner": server.WORKER_ID}
+    return update["$set"]
+
+
+def test_run_job_success_schedules_next_interval(fake_db):
+    job = {"id": "job", "interval": 3600, "run": AsyncMock()}
+    before = datetime.now(timezone.utc)
+    asyncio.run(server.run_job(job, "slot:0"))
+
+    fields = recorded_fields(fake_db)
+    assert fields["failures"] == 0
+    assert fields["next_run_at"] >= before + timedelta(seconds=3600)
+    fake_db.scheduler_slots.update_one.assert_awaited()
+
+
+def test_run_job_failure_backs_off(fake_db):
+    fake_db.scheduler_jobs.find_one.return_value = {"failures": 2}
+    job = {"id": "job", "interval": 3600, "run": AsyncMock(side_effect=RuntimeError("provider down"))}
+    before = datetime.now(timezone.utc)
+    asyncio.run(server.run_job(job, "slot:0"))
+
+    fields = recorded_fields(fake_db)
+    assert fields["failures"] == 3
+    assert fields["last_error"] == "provider down"
+    delay = fields["next_run_at"] - before
+    assert timedelta(seconds=1200) <= delay < timedelta(seconds=1210)
+
+
+def test_run_job_without_interval_waits_for_request(fake_db):
+    job = {"id": "job", "interval": None, "run": AsyncMock()}
+    asyncio.run(server.run_job(job, "slot:0"))
+    assert recorded_fields(fake_db)["next_run_at"] is None